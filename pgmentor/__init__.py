@@ -1,4 +1,4 @@
 __all__ = [
-    'cli', 'configurator', 'db', 'linux_helpers', 'metrics', 'output', 'pgparams'
+    'analyze_query', 'cli', 'configurator', 'db', 'linux_helpers', 'metrics', 'output', 'pgparams'
 ]
 
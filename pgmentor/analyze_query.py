@@ -1,24 +1,117 @@
 from pgmentor.db import Pg
 from openai import OpenAI
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import Optional, TextIO, Tuple
+import hashlib
 import os
+import psycopg2
+import re
+import sys
+
+BAR = "=" * 60
+HDR_QUERY_STATS = f"\n{BAR}\n{' ' * 22}Query Statistics\n{BAR}\n"
+HDR_LOCKS = f"\n{BAR}\n{' ' * 27}Locks\n{BAR}\n"
+HDR_OPT = f"\n{BAR}\n{' ' * 27}Optimization\n{BAR}\n"
+HDR_SLOW = f"\n{BAR}\nTop slow queries from pg_stat_statements\n{BAR}\n"
+
+# runs the AI request while the database side of the analysis is in progress
+_EXEC = ThreadPoolExecutor(max_workers=4)
 
 def calibrate_cost_to_time(pg) -> float:
-    query = "SELECT COUNT(*) FROM pg_class"
+    if pg._cost_to_sec is None:
+        pg._cost_to_sec = _calibrate_once(pg)
+    return pg._cost_to_sec
 
-    plan = pg.qval(f"EXPLAIN (FORMAT JSON) {query}")
-    total_cost = plan[0]["Plan"]["Total Cost"]
 
-    analyze_plan = pg.qval(f"EXPLAIN (ANALYZE, FORMAT JSON) {query}")
-    actual_time = analyze_plan[0]["Plan"]["Actual Total Time"] / 1000.0
+def _calibrate_once(pg) -> float:
+    query = "SELECT COUNT(*) FROM pg_class"
+
+    # an ANALYZE plan carries both the estimated cost and the measured time
+    plan = pg.qval(f"EXPLAIN (ANALYZE, FORMAT JSON) {query}")[0]["Plan"]
+    total_cost = plan["Total Cost"]
+    actual_time = plan["Actual Total Time"] / 1000.0
 
     if total_cost > 0:
         return actual_time / total_cost
     return 0.001
 
 
-def analyze_query(pg, query: str) -> str:
-    sql = f"EXPLAIN (COSTS TRUE, FORMAT JSON, VERBOSE) {query}"
-    result = pg.qval(sql)
+# EXPLAIN can't be used as a subquery, so it is wrapped in a session-local function
+# that lets the plan and the pg_class row of its top relation come back in one round trip.
+EXPLAIN_FN_SQL = """
+CREATE OR REPLACE FUNCTION pg_temp.pgmentor_explain(q text) RETURNS jsonb
+LANGUAGE plpgsql AS $$
+DECLARE r jsonb;
+BEGIN
+    EXECUTE 'EXPLAIN (COSTS TRUE, FORMAT JSON, VERBOSE) ' || q INTO r;
+    RETURN r;
+END $$;
+"""
+
+EXPLAIN_SQL = """
+SELECT e.plan, c.relpages, c.reltuples
+FROM (SELECT pg_temp.pgmentor_explain($1) AS plan) e
+LEFT JOIN LATERAL (
+    SELECT relpages, reltuples
+    FROM pg_class
+    WHERE relname = e.plan->0->'Plan'->>'Relation Name'
+    LIMIT 1
+) c ON true
+"""
+
+
+# Plain fallback: the plan, then the pg_class row of its top relation in a second query.
+RELINFO_SQL = "SELECT relpages, reltuples FROM pg_class WHERE relname = %s LIMIT 1"
+
+# A temp function can't be created on a hot standby, in a read-only session or
+# without the TEMP privilege; check the first two up front, catch the rest.
+READ_ONLY_SQL = "SELECT pg_is_in_recovery() OR current_setting('transaction_read_only')::bool"
+
+# undefined_function, invalid_sql_statement_name: the session behind the connection
+# lost the temp function or the prepared statement
+_LOST_SESSION_CODES = ("42883", "26000")
+
+
+def _explain_fn_available(pg: Pg) -> bool:
+    if pg._explain_fn is None:
+        pg._explain_fn = False
+        if not pg.qval(READ_ONLY_SQL):
+            try:
+                pg.exec(EXPLAIN_FN_SQL)
+                pg._explain_fn = True
+            except Exception:
+                pass
+    return pg._explain_fn
+
+
+def explain_with_relinfo(pg: Pg, query: str):
+    if _explain_fn_available(pg):
+        # the query text is only a parameter, so the outer statement is planned once
+        try:
+            pg.prepare("pgmentor_plan", EXPLAIN_SQL)
+            return pg.qrow("EXECUTE pgmentor_plan(%s)", (query,))
+        except psycopg2.Error as e:
+            # behind a transaction-mode pooler the next backend may have neither the
+            # function nor the prepared statement; anything else (an invalid query)
+            # is the user's error and leaves the fast path in place
+            if e.pgcode not in _LOST_SESSION_CODES:
+                raise
+            pg._explain_fn = False
+            pg._prepared.discard("pgmentor_plan")
+
+    plan = pg.qval(f"EXPLAIN (COSTS TRUE, FORMAT JSON, VERBOSE) {query}")
+    relname = plan[0]["Plan"].get("Relation Name")
+    relinfo = pg.qrow(RELINFO_SQL, (relname,)) if relname else None
+    return (plan, *(relinfo or (None, None)))
+
+
+def analyze_query(pg, query: str, out: TextIO = sys.stdout) -> None:
+    # EXPLAIN first: it is cheap and rejects invalid SQL before any AI request is
+    # started; the request then overlaps calibration and the lock probe
+    result, relpages, reltuples = explain_with_relinfo(pg, query)
+    optimize_fut = _EXEC.submit(optimize_query, query)
+
     plan_json = result[0]
     
     plan = plan_json["Plan"]
@@ -27,72 +120,96 @@ def analyze_query(pg, query: str) -> str:
     est_width = plan["Plan Width"]
     total_volume = est_rows * est_width
 
-    seq_page_cost = float(pg.qval("SHOW seq_page_cost")[0][0])
-    random_page_cost = float(pg.qval("SHOW random_page_cost")[0][0])
-    work_mem = pg.qval("SHOW work_mem")[0][0]
+    seq_page_cost = float(pg.get_setting("seq_page_cost"))
+    random_page_cost = float(pg.get_setting("random_page_cost"))
+    work_mem = pg.get_setting("work_mem")
 
     cost_to_sec = calibrate_cost_to_time(pg)
-    total_time = total_cost * cost_to_sec\
-
-    analysis = "\n" + "="*60 + "\n" +  ' '*22 +"Query Statistics" + "\n" + "="*60 + "\n"
-    analysis += f"Total cost: {total_cost}\n"
-    analysis += f"Estimated time: {total_time:.6f} s\n"
-    analysis += f"Estimated rows: {est_rows}\n"
-    analysis += f"Estimated row size: {est_width} bytes\n"
-    analysis += f"Estimated volume: {total_volume} bytes\n"
-    analysis += f"work_mem: {work_mem}\n"
-    analysis += f"seq_page_cost: {seq_page_cost}, random_page_cost: {random_page_cost}\n"
-
-    if "Relation Name" in plan:
+    total_time = total_cost * cost_to_sec
+
+    stats = [HDR_QUERY_STATS]
+    stats.append(f"Total cost: {total_cost}\n")
+    stats.append(f"Estimated time: {total_time:.6f} s\n")
+    stats.append(f"Estimated rows: {est_rows}\n")
+    stats.append(f"Estimated row size: {est_width} bytes\n")
+    stats.append(f"Estimated volume: {total_volume} bytes\n")
+    stats.append(f"work_mem: {work_mem}\n")
+    stats.append(f"seq_page_cost: {seq_page_cost}, random_page_cost: {random_page_cost}\n")
+
+    if "Relation Name" in plan and relpages is not None:
         relname = plan["Relation Name"]
-        relinfo = pg.qrow("""
-            SELECT relpages, reltuples
-            FROM pg_class
-            WHERE relname = %s
-        """, (relname,))
-        if relinfo:
-            relpages, reltuples = relinfo
-            analysis += f"\nRelation {relname}: {relpages} pages, {reltuples} tuples\n"
+        stats.append(f"\nRelation {relname}: {relpages} pages, {reltuples} tuples\n")
+    out.write("".join(stats))
+    out.flush()
 
     locks = analyze_locks(pg, query)
     if locks:
-        analysis += "\n" + "="*60 + "\n" + ' '*27 + "Locks" + "\n" + "="*60 + "\n" + locks
-
-    optimize = optimize_query(query)
-
-    analysis += f"\n" + "="*60 + "\n" + ' '*27 + "Optimization" + "\n" + "="*60 + "\n" + optimize + "\n" + "="*60 + "\n"
+        out.write(HDR_LOCKS + locks)
+        out.flush()
+
+    optimize = optimize_fut.result()
+
+    out.write(HDR_OPT + optimize + "\n" + BAR + "\n")
+
+# Locks held by the probing backend and the sessions waiting on them, tagged by kind.
+# Waiters come from pg_blocking_pids(), which also sees relation-level conflicts
+# such as a pending ALTER TABLE queued behind the locks PREPARE takes. Only backends
+# waiting on a heavyweight lock can be blocked by the probe, so the cheap wait_event
+# filter runs first and pg_blocking_pids() is called for those alone.
+LOCKS_SQL = """
+WITH mine AS (
+    SELECT
+        l.locktype,
+        l.mode,
+        l.granted,
+        COALESCE(c.relname, 'N/A') AS relation_name,
+        l.page,
+        l.tuple,
+        l.virtualxid,
+        l.transactionid
+    FROM pg_locks l
+    LEFT JOIN pg_class c ON c.oid = l.relation
+    WHERE l.pid = $1
+)
+SELECT 'lock' AS kind, mine.*,
+       NULL::int AS blocked_pid, NULL::text AS blocked_query, NULL::interval AS duration
+FROM mine
+UNION ALL
+SELECT 'blocked', NULL, NULL, NULL, NULL, NULL, NULL, NULL, NULL,
+       blocked.pid,
+       substring(blocked.query for 60),
+       now() - blocked.query_start
+FROM pg_stat_activity blocked
+WHERE blocked.wait_event_type = 'Lock'
+  AND blocked.pid <> $1
+  AND $1 = ANY(pg_blocking_pids(blocked.pid))
+ORDER BY kind DESC, granted DESC, mode
+"""
 
-    return analysis
 
 def analyze_locks(pg: Pg, query: str) -> str:
+    # prepare outside the probe transaction so a failing query can't abort it
+    pg.prepare("pgmentor_locks", LOCKS_SQL)
     pg.begin()
-    pid = pg.qval("SELECT pg_backend_pid();")
+    # libpq already knows the backend PID, no need for a pg_backend_pid() round trip
+    pid = pg.conn.get_backend_pid()
 
+    # PREPARE parses and plans the query, taking the same relation locks it would
+    # run with, without executing it; the locks are held until the rollback below.
     try:
-        pg.exec(query);
+        pg.exec(f"PREPARE pgmentor_probe AS {query}")
     except Exception as e:
         pg.rollback()
         return None
 
-    locks = pg.qall("""
-        SELECT 
-            l.locktype,
-            l.mode,
-            l.granted,
-            COALESCE(c.relname, 'N/A') AS relation_name,
-            l.page,
-            l.tuple,
-            l.virtualxid,
-            l.transactionid
-        FROM pg_locks l
-        LEFT JOIN pg_class c ON c.oid = l.relation
-        WHERE l.pid = %s
-        ORDER BY l.granted DESC, l.mode;
-    """, (pid,))
-
-    res_locks = f"Locks held by PID {pid}:\n"
+    rows = pg.qall("EXECUTE pgmentor_locks(%s)", (pid,))
+    pg.exec("DEALLOCATE pgmentor_probe")
+    locks = [r[1:9] for r in rows if r[0] == 'lock']
+    blockers = [r[9:] for r in rows if r[0] == 'blocked']
+
+    out = [f"Locks held by PID {pid}:\n"]
     if not locks:
-        res_locks += " No locks held."
+        out.append(" No locks held.")
     else:
         for lock in locks:
             locktype, mode, granted, relname, page, tup, vxid, xid = lock
@@ -109,38 +226,79 @@ def analyze_locks(pg: Pg, query: str) -> str:
             else:
                 obj = locktype
 
-            res_locks += f" [{status}] {mode} on {locktype} → {obj}\n"
-
-
-    blockers = pg.qall("""
-        SELECT 
-            blocked.pid AS blocked_pid,
-            substring(blocked.query for 60) AS blocked_query,
-            now() - blocked.query_start AS duration
-        FROM pg_locks l
-        JOIN pg_stat_activity blocked ON blocked.pid = l.pid
-        WHERE l.pid != %s
-          AND l.locktype IN ('relation', 'tuple', 'transactionid')
-          AND l.transactionid IN (
-            SELECT transactionid FROM pg_locks WHERE pid = %s AND granted
-          )
-          AND NOT l.granted;
-    """, (pid, pid))
-
-    res_locks += f"\n Who is blocked by PID {pid}?\n"
+            out.append(f" [{status}] {mode} on {locktype} → {obj}\n")
+
+    out.append(f"\n Who is blocked by PID {pid}?\n")
     if not blockers:
-        res_locks += "  No one is blocked (at the moment).\n"
+        out.append("  No one is blocked (at the moment).\n")
     else:
         for blocked_pid, bquery, duration in blockers:
-            res_locks += f"  PID {blocked_pid} is waiting: '{bquery.strip()}...' | ⏱️ {duration}\n"
+            out.append(f"  PID {blocked_pid} is waiting: '{bquery.strip()}...' | ⏱️ {duration}\n")
     
     pg.rollback()
     pg.conn.autocommit = True
-    return res_locks
+    return "".join(out)
     
 
+# On-disk cache of AI replies, keyed by a hash of the normalized query text
+LLM_CACHE_DIR = os.path.join(os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache"), "pgmentor", "llm")
+LLM_CACHE_MAX = 256
+_LITERAL_RE = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_SPACE_RE = re.compile(r"\s+")
+
+
+def query_cache_key(query: str) -> str:
+    # strip literals and whitespace/case differences, like pg_stat_statements does
+    norm = _LITERAL_RE.sub("?", query)
+    norm = _SPACE_RE.sub(" ", norm).strip().lower()
+    return hashlib.sha256(norm.encode()).hexdigest()
+
+
+def _llm_cache_get(key: str) -> Optional[str]:
+    path = os.path.join(LLM_CACHE_DIR, key)
+    try:
+        with open(path, "r") as f:
+            reply = f.read()
+        os.utime(path)  # mark as recently used
+        return reply
+    except Exception:
+        return None
+
+
+def _llm_cache_put(key: str, reply: str) -> None:
+    path = os.path.join(LLM_CACHE_DIR, key)
+    try:
+        os.makedirs(LLM_CACHE_DIR, exist_ok=True)
+        tmp = path + ".tmp"
+        with open(tmp, "w") as f:
+            f.write(reply)
+        os.replace(tmp, path)
+        # evict least recently used entries
+        entries = [e for e in os.scandir(LLM_CACHE_DIR) if e.is_file()]
+        if len(entries) > LLM_CACHE_MAX:
+            entries.sort(key=lambda e: e.stat().st_mtime)
+            for e in entries[:len(entries) - LLM_CACHE_MAX]:
+                os.remove(e.path)
+    except Exception:
+        pass
+
+
+_CLIENT = None
+
+
+def _client() -> OpenAI:
+    # one client per process so the HTTP connection pool (and TLS session) is reused
+    global _CLIENT
+    if _CLIENT is None:
+        _CLIENT = OpenAI(api_key=os.environ.get("API_KEY_DEEPSEEK"), base_url="https://api.deepseek.com", timeout=180.0)
+    return _CLIENT
+
+
 def optimize_query(query: str) -> str:
-    client_deepseek = OpenAI(api_key=os.environ.get("API_KEY_DEEPSEEK"), base_url="https://api.deepseek.com", timeout=180.0)
+    key = query_cache_key(query)
+    cached = _llm_cache_get(key)
+    if cached is not None:
+        return cached
 
     INIT_CONTENT = """
     You are a sql query optimizer. 
@@ -148,7 +306,7 @@ def optimize_query(query: str) -> str:
     Then suggest indexes that must exist for this query so that it works as efficiently as possible. Don't use Markdown.
     """
     try:
-        response = client_deepseek.chat.completions.create(
+        response = _client().chat.completions.create(
             model="deepseek-chat",
             messages=[
                 {"role": "system", "content": INIT_CONTENT},
@@ -162,20 +320,46 @@ def optimize_query(query: str) -> str:
     except Exception as e:
         return f"Error accessing AI: {e}."  
     
+    _llm_cache_put(key, reply)
     return reply
 
-def make_recommendations(query: str, rows_out: int, mean_time: float, blks_read: int) -> list[str]:
+# Keywords inspected by make_recommendations, matched in a single regex pass.
+# Each keyword owns one bit of the mask returned by scan_keywords().
+KEYWORDS = ("select *", "order by", "limit", "where", "index", "join", "nested loop", " on ")
+(KW_SELECT_STAR, KW_ORDER_BY, KW_LIMIT, KW_WHERE,
+ KW_INDEX, KW_JOIN, KW_NESTED_LOOP, KW_ON) = (1 << i for i in range(len(KEYWORDS)))
+# zero-width lookahead so keywords that touch or overlap ("joindex") are all reported
+_KW_RE = re.compile("(?=(" + "|".join(re.escape(kw) for kw in KEYWORDS) + "))")
+_KW_BITS = {kw: 1 << i for i, kw in enumerate(KEYWORDS)}
+
+
+@lru_cache(maxsize=1024)
+def scan_keywords(query: str) -> Tuple[int, int]:
+    """Return (keyword bitmask, number of JOINs) for a query, case-insensitively."""
+    mask = 0
+    joins = 0
+    for m in _KW_RE.finditer(query.lower()):
+        bit = _KW_BITS[m.group(1)]
+        mask |= bit
+        if bit == KW_JOIN:
+            joins += 1
+    return mask, joins
+
+
+def make_recommendations(query: str, rows_out: int, mean_time: float, blks_read: int,
+                         kw: Optional[Tuple[int, int]] = None) -> list[str]:
+    # kw is a precomputed (mask, joins) pair, e.g. from SLOW_QUERIES_SQL
     recs = []
-    q = query.lower()
+    mask, joins = kw if kw is not None else scan_keywords(query)
 
     # General
-    if "select *" in q:
+    if mask & KW_SELECT_STAR:
         recs.append("Avoid SELECT * — use explicit column list to reduce data volume.")
 
-    if "order by" in q and "limit" not in q:
+    if mask & KW_ORDER_BY and not mask & KW_LIMIT:
         recs.append("Add LIMIT when using ORDER BY to reduce sorting cost.")
 
-    if blks_read > 1000 and "where" in q and "index" not in q:
+    if blks_read > 1000 and mask & KW_WHERE and not mask & KW_INDEX:
         recs.append("Query reads too many blocks — consider adding an index on the WHERE condition.")
 
     if rows_out > 1_000_000:
@@ -185,22 +369,24 @@ def make_recommendations(query: str, rows_out: int, mean_time: float, blks_read:
         recs.append("Query is slow — consider caching or rewriting it.")
 
     # Joins
-    if "join" in q:
-        if "nested loop" in q:
+    if mask & KW_JOIN:
+        if mask & KW_NESTED_LOOP:
             recs.append("Nested Loop Join detected — consider adding indexes or forcing Hash/Merge Join.")
-        if "join" in q and " on " not in q:
+        if not mask & KW_ON:
             recs.append("JOIN without explicit ON condition detected — may produce Cartesian product.")
-        if "select *" in q and q.count("join") > 1:
+        if mask & KW_SELECT_STAR and joins > 1:
             recs.append("Multiple JOINs with SELECT * — select only required columns to reduce memory usage.")
 
     return recs
 
 
-def analyze_stats(pg):
-    """
-    Analyze pg_stat_statements for slow queries and generate recommendations.
-    """
-    sql = """
+# Same bit layout as scan_keywords(), evaluated server-side on the top rows only
+KW_MASK_SQL = " | ".join(
+    f"((position('{kw}' in l.q) > 0)::int << {i})" for i, kw in enumerate(KEYWORDS)
+)
+
+SLOW_QUERIES_SQL = f"""
+WITH top AS (
     SELECT query,
            calls,
            total_exec_time,
@@ -209,27 +395,45 @@ def analyze_stats(pg):
            shared_blks_hit,
            shared_blks_read
     FROM pg_stat_statements
+    WHERE mean_exec_time > 1
     ORDER BY mean_exec_time DESC
-    LIMIT 20;
+    LIMIT 20
+)
+SELECT top.*,
+       {KW_MASK_SQL} AS kw_mask,
+       (length(l.q) - length(replace(l.q, 'join', ''))) / 4 AS joins
+FROM top
+CROSS JOIN LATERAL (SELECT lower(top.query) AS q) l
+ORDER BY mean_exec_time DESC
+"""
+
+SLOW_ROW_FMT = (
+    "Query: {q}...\n"
+    "  Calls: {c}\n"
+    "  Total time: {tt:.2f} ms, Avg: {mt:.2f} ms\n"
+    "  Rows: {r}\n"
+    "  Buffers: hit={h}, read={rd}\n"
+)
+
+
+def analyze_stats(pg, out: TextIO = sys.stdout) -> None:
+    """
+    Analyze pg_stat_statements for slow queries and generate recommendations.
+    The report is written to out one query at a time as rows arrive.
     """
-    rows = pg.qall(sql)
+    rows = pg.qiter(SLOW_QUERIES_SQL, name="pgmentor_slow")
 
-    report = "\n" + "="*60 + "\n"
-    report += "Top slow queries from pg_stat_statements\n"
-    report += "="*60 + "\n"
+    out.write(HDR_SLOW)
 
     for r in rows:
-        query, calls, total_time, mean_time, rows_out, blks_hit, blks_read = r
-        report += f"Query: {query.strip()[:200]}...\n"
-        report += f"  Calls: {calls}\n"
-        report += f"  Total time: {total_time:.2f} ms, Avg: {mean_time:.2f} ms\n"
-        report += f"  Rows: {rows_out}\n"
-        report += f"  Buffers: hit={blks_hit}, read={blks_read}\n"
-
-        recs = make_recommendations(query, rows_out, mean_time, blks_read)
+        query, calls, total_time, mean_time, rows_out, blks_hit, blks_read, kw_mask, joins = r
+        report = [SLOW_ROW_FMT.format(q=query.strip()[:200], c=calls, tt=total_time, mt=mean_time,
+                                      r=rows_out, h=blks_hit, rd=blks_read)]
+
+        recs = make_recommendations(query, rows_out, mean_time, blks_read, (kw_mask, joins))
         if recs:
-            report += "  Recommendations:\n"
+            report.append("  Recommendations:\n")
             for rec in recs:
-                report += f"    - {rec}\n"
-        report += "\n"
-    return report
\ No newline at end of file
+                report.append(f"    - {rec}\n")
+        report.append("\n")
+        out.write("".join(report))
\ No newline at end of file
@@ -1,4 +1,6 @@
 import argparse
+import sys
+from contextlib import nullcontext
 from pgmentor.configurator import section_pg_params, run_all_sections
 from pgmentor.metrics import gather_metrics
 from pgmentor.db import Pg
@@ -23,17 +25,13 @@ def main():
             m = gather_metrics(pg)
             section_pg_params(pg, m, args.profile, args.out_file)
             run_all_sections(pg)
-        elif args.query:
-            query_analysis_result = analyze_query(pg, args.query)
-        elif args.analyze_stats:
-            query_analysis_result = analyze_stats(pg)
-
-        if args.query or args.analyze_stats:
-            if args.out_file:
-                with open(args.out_file, "w") as f:
-                    f.write(query_analysis_result)
-            else:
-                print(query_analysis_result)
+        elif args.query or args.analyze_stats:
+            # reports are streamed to the destination as each section is produced
+            with (open(args.out_file, "w") if args.out_file else nullcontext(sys.stdout)) as out:
+                if args.query:
+                    analyze_query(pg, args.query, out)
+                else:
+                    analyze_stats(pg, out)
 
     return 0
 
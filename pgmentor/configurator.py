@@ -1,69 +1,71 @@
-from typing import List, Tuple, Dict
+from typing import List, Optional, Tuple
+from collections import Counter
+import io
+import sys
 from pgmentor.metrics import Metrics
-from pgmentor.output import h1, print_kv_table
+from pgmentor.output import h1, print_kv_table, print_result
 import time
 from pgmentor.db import Pg
 from pgmentor.pgparams import build_reco
-from psycopg2.extras import execute_values
+
+
+# diff of pg_settings against the recommendations, passed as five parallel text[]
+RECO_DIFF_SQL = """
+WITH diff AS (
+  SELECT s.name,
+         s.setting::text                        AS cur,
+         r.rec                                  AS rec,
+         r.why                                  AS why,
+         r.priority                             AS priority,
+         r.speedup                               AS speedup,
+         s.context,
+         (s.setting::text <> r.rec)::bool       AS differs,
+         (s.context = 'postmaster')::bool       AS needs_restart,
+         CASE
+           WHEN s.context = 'postmaster'                 THEN 'restart'
+           WHEN s.context IN ('sighup','superuser')      THEN 'reload'
+           WHEN s.context IN ('backend','user')          THEN 'session'
+           WHEN s.name LIKE 'autovacuum_%'
+                OR s.name IN ('fillfactor','toast_tuple_target')
+                                                THEN 'table'
+           ELSE 'internal'
+         END                                            AS scope
+  FROM pg_settings s
+  JOIN unnest($1::text[], $2::text[], $3::text[], $4::text[], $5::text[])
+       AS r(parameter, rec, why, priority, speedup) ON r.parameter = s.name
+)
+SELECT name, cur, rec,
+       CASE WHEN differs THEN scope ELSE 'ok' END AS action,
+       why,
+       priority,
+       speedup,
+       CASE WHEN differs THEN format('ALTER SYSTEM SET %I = %L;', name, rec) END AS alter_stmt
+FROM diff
+ORDER BY differs DESC, priority DESC, name;
+"""
 
 
 def section_pg_params(pg: Pg, m: Metrics, profile: str, out_file: str | None) -> None:
     h1("1) PG parameters")
-    # build temp table reco
+    # recommendations travel as parallel text[] parameters and are unnested in the diff query
     rows = build_reco(pg, m, profile)
-    with pg.conn.cursor() as cur:
-        cur.execute("CREATE TEMP TABLE reco(parameter text, rec text, why text, priority text, speedup text);")
-        execute_values(cur, "INSERT INTO reco(parameter, rec, why, priority, speedup) VALUES %s", rows[1:])
-        pg.conn.commit()
+    reco_cols = tuple(list(col) for col in zip(*rows[1:]))
 
-    sql = """
-    WITH diff AS (
-      SELECT s.name,
-             s.setting::text                        AS cur,
-             r.rec                                  AS rec,
-             r.why                                  AS why,
-             r.priority                             AS priority,
-             r.speedup                               AS speedup,
-             s.context,
-             (s.setting::text <> r.rec)::bool       AS differs,
-             (s.context = 'postmaster')::bool       AS needs_restart,
-             CASE
-               WHEN s.context = 'postmaster'                 THEN 'restart'
-               WHEN s.context IN ('sighup','superuser')      THEN 'reload'
-               WHEN s.context IN ('backend','user')          THEN 'session'
-               WHEN s.name LIKE 'autovacuum_%'
-                    OR s.name IN ('fillfactor','toast_tuple_target')
-                                                    THEN 'table'
-               ELSE 'internal'
-             END                                            AS scope
-      FROM pg_settings s
-      JOIN reco r ON r.parameter = s.name
-    )
-    SELECT name, cur, rec,
-           CASE WHEN differs THEN scope ELSE 'ok' END AS action,
-           why,
-           priority,
-           speedup
-    FROM diff
-    ORDER BY differs DESC, priority DESC, name;
-    """
-    rows_out = pg.qall(sql)
+    # planned once per connection, then only the recommendation arrays are sent
+    pg.prepare("pgmentor_diff", RECO_DIFF_SQL)
+    rows_out = pg.qall("EXECUTE pgmentor_diff(%s, %s, %s, %s, %s)", reco_cols)
 
     tbl: List[Tuple[str, str, str, str, str, str, str]] = []
-    for name, cur, rec, action, why, priority, speedup in rows_out:
-        tbl.append((str(name).ljust(32), str(cur).ljust(12), str(rec).ljust(12), action, why, priority, speedup))
+    for name, cur, rec, action, why, priority, speedup, _alter in rows_out:
+        # print_kv_table pads every column itself
+        tbl.append((str(name), str(cur), str(rec), action, why, priority, speedup))
     print_kv_table(tbl)
 
     # Write recommended ALTER SYSTEM statements to file if requested
     if out_file:
-        stmts: List[str] = []
-        # Only include settings that differ from current values
-        for name, cur, rec, action, _why, _priority, _speedup in rows_out:
-            if action != 'ok':
-                # escape single quotes in value
-                val = str(rec).replace("'", "''")
-                ident = name.replace('"', '""')
-                stmts.append(f"ALTER SYSTEM SET \"{ident}\" = '{val}';")
+        # Only include settings that differ from current values; quoting is done server-side
+        stmts: List[str] = [alter for _name, _cur, _rec, action, _why, _priority, _speedup, alter in rows_out
+                            if action != 'ok']
         # Add a helpful comment for reload/restart guidance
         header = [
             "-- pgmentor recommendations",
@@ -77,260 +79,323 @@ def section_pg_params(pg: Pg, m: Metrics, profile: str, out_file: str | None) ->
 
 
 def print_query(pg: Pg, sql: str) -> None:
-    rows = pg.qall(sql)
-    if not rows:
-        print("(no rows)")
+    # one section on its own; an error is printed in place of its table
+    try:
+        desc, rows = pg.qall_desc(sql)
+    except Exception as e:
+        print(f"(error: {str(e).strip()})")
         return
-    # headers from cursor description: re-execute to get description safely
-    with pg.conn.cursor() as cur:
-        cur.execute(sql)
-        desc = [d.name for d in cur.description]
-        # compute widths
-        width = [max(len(str(x)) for x in [desc[i]] + [r[i] for r in rows]) for i in range(len(desc))]
-        # print header
-        fmt = " | ".join("{:%d}" % w for w in width)
-        print(fmt.format(*desc))
-        print("-+-".join("-" * w for w in width))
-        for r in rows:
-            print(fmt.format(*[str(x) for x in r]))
+    print_result(desc, rows)
+
+
+# Prepare both variants to be resilient across PG versions
+CKPT_SQL_CHECKPOINTER = """
+    SELECT
+      num_timed              AS timed_ckpt,
+      num_requested          AS req_ckpt,
+      round(num_requested*100.0/NULLIF(num_timed+num_requested,0),1) AS "req_%",
+      buffers_written        AS buf_ckpt,
+      (SELECT buffers_clean FROM pg_stat_bgwriter)         AS buf_bgwriter,
+      NULL::bigint           AS buf_backend,
+      NULL::bigint           AS backend_fsync,
+      (SELECT buffers_alloc FROM pg_stat_bgwriter)         AS buf_alloc
+    FROM pg_stat_checkpointer;
+"""
+CKPT_SQL_BGWRITER = """
+    SELECT
+      NULL::bigint            AS timed_ckpt,
+      NULL::bigint            AS req_ckpt,
+      NULL::numeric           AS "req_%",
+      NULL::bigint            AS buf_ckpt,
+      buffers_clean           AS buf_bgwriter,
+      buffers_backend         AS buf_backend,
+      buffers_backend_fsync   AS backend_fsync,
+      buffers_alloc           AS buf_alloc
+    FROM pg_stat_bgwriter;
+"""
+
+# Catalog-only size estimate per table (heap + TOAST + indexes, as of the last
+# VACUUM/ANALYZE). Sections filter and rank on it, then stat the real sizes
+# only for the rows they show.
+REL_SIZE_EST_CTE = """est AS (
+        SELECT c.oid AS relid,
+               (c.relpages + COALESCE(t.relpages, 0)
+                + COALESCE((SELECT sum(ic.relpages) FROM pg_index i
+                            JOIN pg_class ic ON ic.oid = i.indexrelid
+                            WHERE i.indrelid = c.oid), 0))::bigint
+               * current_setting('block_size')::bigint AS est_bytes
+        FROM pg_class c
+        JOIN pg_namespace n ON n.oid = c.relnamespace
+        LEFT JOIN pg_class t ON t.oid = c.reltoastrelid
+        WHERE c.relkind = 'r'
+          AND n.nspname NOT IN ('pg_catalog','information_schema','pg_toast')
+    )"""
+
+SECTIONS: List[Tuple[str, str]] = [
+    ("2) Checkpoint & bgwriter", "__CKPT__"),
+    ("3) Large tables for partitioning (>20GB)",
+    f"""
+    WITH {REL_SIZE_EST_CTE}, big AS (
+        SELECT relid FROM est
+        WHERE est_bytes > (20::bigint * 1024 * 1024 * 1024)
+        ORDER BY est_bytes DESC
+        LIMIT 20
+    )
+    SELECT 
+        schemaname || '.' || relname AS table_name,
+        pg_size_pretty(pg_total_relation_size(relid)) AS total_size,
+        pg_size_pretty(pg_relation_size(relid)) AS table_size,
+        pg_size_pretty(
+            (pg_total_relation_size(relid)::bigint - pg_relation_size(relid)::bigint)
+        ) AS index_size,
+        n_live_tup AS live_rows,
+        n_dead_tup AS dead_rows,
+        round(n_dead_tup*100.0/NULLIF(n_live_tup+n_dead_tup,0),1) AS dead_pct,
+        seq_scan,
+        idx_scan,
+        round(idx_scan*100.0/NULLIF(seq_scan+idx_scan,0),1) AS idx_scan_pct
+    FROM big
+    JOIN pg_stat_user_tables USING (relid)
+    ORDER BY pg_total_relation_size(relid) DESC;
+    """),
+    ("4) HOT updates (low %)",
+     """
+     SELECT n.nspname||'.'||c.relname       AS table,
+            s.upd,
+            s.hot,
+            round(s.hot*100.0/NULLIF(s.upd,0),1) AS hot_pct
+     FROM pg_class c
+     JOIN pg_namespace n ON n.oid = c.relnamespace,
+          LATERAL (SELECT pg_stat_get_tuples_updated(c.oid)     AS upd,
+                          pg_stat_get_tuples_hot_updated(c.oid) AS hot) s
+     WHERE c.relkind IN ('r','m')
+       AND n.nspname NOT IN ('pg_catalog','information_schema') AND n.nspname !~ '^pg_toast'
+       AND s.upd > 100
+     ORDER BY hot_pct NULLS FIRST
+     LIMIT 20;
+     """),
+    ("5) Seq vs Index scan",
+     """
+     SELECT t."table", t.seq_scan, t.idx_scan, t.idx_pct,
+            pg_size_pretty(pg_relation_size(t.relid))          AS size
+     FROM (
+       SELECT c.oid                                            AS relid,
+              n.nspname||'.'||c.relname                        AS table,
+              s.seq_scan, s.idx_scan,
+              round(s.idx_scan*100.0/NULLIF(s.seq_scan+s.idx_scan,0),1) AS idx_pct
+       FROM pg_class c
+       JOIN pg_namespace n ON n.oid = c.relnamespace,
+            LATERAL (SELECT pg_stat_get_numscans(c.oid) AS seq_scan,
+                            (SELECT sum(pg_stat_get_numscans(i.indexrelid))::bigint
+                             FROM pg_index i WHERE i.indrelid = c.oid) AS idx_scan) s
+       WHERE c.relkind IN ('r','m')
+         AND n.nspname NOT IN ('pg_catalog','information_schema') AND n.nspname !~ '^pg_toast'
+         AND s.seq_scan + s.idx_scan > 0
+       ORDER BY s.seq_scan DESC
+       LIMIT 20
+     ) t
+     ORDER BY t.seq_scan DESC;
+     """),
+    ("6) Duplicate indexes",
+     """
+     WITH dup AS (
+       SELECT array_agg(indexrelid) AS idx
+       FROM pg_index
+       WHERE indisvalid
+       GROUP BY md5(indrelid::text||':'||indkey::text||':'||
+                    COALESCE(indexprs::text,'')||':'||COALESCE(indpred::text,''))
+       HAVING COUNT(*) > 1
+     )
+     -- sizes are stat'ed only for indexes that actually have a duplicate
+     -- arrays go out as text so batched (json) and per-section results print alike
+     SELECT pg_size_pretty(s.sz)        AS dup_size,
+            d.idx::regclass[]::text     AS dup_indexes
+     FROM dup d,
+          LATERAL (SELECT SUM(pg_relation_size(x)) AS sz FROM unnest(d.idx) x) s
+     ORDER BY s.sz DESC;
+     """),
+    ("7) FK without indexes",
+     """
+     WITH fk AS (
+       SELECT conrelid, conname, conkey, confrelid
+       FROM pg_constraint WHERE contype='f'
+     ), mis AS (
+       SELECT fk.conrelid::regclass AS child_table,
+              array_agg(att.attname ORDER BY att.attnum)   AS key_cols,
+              fk.confrelid::regclass AS parent_table,
+              fk.conname             AS fk_name
+       FROM fk
+       JOIN pg_attribute att ON att.attrelid = fk.conrelid
+                            AND att.attnum   = ANY(fk.conkey)
+       WHERE NOT EXISTS (
+             SELECT 1 FROM pg_index i
+             WHERE i.indrelid = fk.conrelid
+               AND i.indisvalid
+               AND array_length(fk.conkey,1) <= i.indnkeyatts  -- INCLUDE columns don't count
+               AND (i.indkey::int2[])[0:array_length(fk.conkey,1)-1] = fk.conkey
+       )
+       GROUP BY child_table, parent_table, fk_name
+     )
+     SELECT child_table,
+            key_cols::text AS key_cols,
+            parent_table,
+            fk_name
+     FROM mis
+     ORDER BY child_table;
+     """),
+    ("8) Big tables without PK",
+     f"""
+     WITH {REL_SIZE_EST_CTE}, big AS (
+       SELECT relid FROM est
+       WHERE est_bytes > 100*1024*1024
+         AND NOT EXISTS (SELECT 1 FROM pg_constraint WHERE contype='p' AND conrelid=est.relid)
+       ORDER BY est_bytes DESC
+       LIMIT 20
+     )
+     SELECT c.relname                 AS table,
+            pg_size_pretty(pg_total_relation_size(c.oid)) AS total,
+            c.reltuples::bigint        AS rows
+     FROM big
+     JOIN pg_class c ON c.oid = big.relid
+     ORDER BY pg_total_relation_size(c.oid) DESC;
+     """),
+    ("9) Unused indexes",
+     """
+     SELECT schemaname||'.'||relname        AS table,
+            indexrelname                    AS index,
+            pg_size_pretty(pg_relation_size(indexrelid)) AS size,
+            idx_scan
+     FROM pg_stat_user_indexes
+     JOIN pg_index  USING (indexrelid)
+     WHERE idx_scan = 0
+       AND indisunique IS FALSE
+       AND pg_relation_size(indexrelid) > 10*1024*1024
+     ORDER BY pg_relation_size(indexrelid) DESC
+     LIMIT 20;
+     """),
+    ("10) Dead-tuples / bloat",
+     """
+     SELECT t."table", t.n_live_tup, t.n_dead_tup, t.dead_pct,
+            pg_size_pretty(pg_total_relation_size(t.relid))           AS total_size
+     FROM (
+       SELECT c.oid                                        AS relid,
+              n.nspname||'.'||c.relname                    AS table,
+              s.n_live_tup, s.n_dead_tup,
+              round(s.n_dead_tup*100.0/NULLIF(s.n_live_tup+s.n_dead_tup,0),1) AS dead_pct
+       FROM pg_class c
+       JOIN pg_namespace n ON n.oid = c.relnamespace,
+            LATERAL (SELECT pg_stat_get_live_tuples(c.oid) AS n_live_tup,
+                            pg_stat_get_dead_tuples(c.oid) AS n_dead_tup) s
+       WHERE c.relkind IN ('r','m')
+         AND n.nspname NOT IN ('pg_catalog','information_schema') AND n.nspname !~ '^pg_toast'
+         AND s.n_dead_tup > 0
+       ORDER BY dead_pct DESC
+       LIMIT 20
+     ) t
+     ORDER BY t.dead_pct DESC;
+     """),
+    ("11) Temp-files usage",
+     """
+     SELECT datname,
+            temp_files,
+            pg_size_pretty(temp_bytes) AS temp_bytes
+     FROM pg_stat_database
+     WHERE temp_files > 0
+     ORDER BY temp_bytes DESC
+     LIMIT 15;
+     """),
+    ("12) XID freeze age (databases)",
+     """
+     WITH cur AS (SELECT txid_current()::bigint AS nowxid)
+     SELECT datname,
+            age(datfrozenxid)                          AS age_xid,
+            2000000000 - age(datfrozenxid)             AS xids_left
+     FROM pg_database, cur
+     ORDER BY age_xid DESC;
+     """),
+    ("13) XID freeze age (tables)",
+     """
+     WITH cur AS (SELECT txid_current()::bigint AS nowxid)
+     SELECT n.nspname||'.'||c.relname            AS table,
+            age(c.relfrozenxid)                  AS age_xid,
+            2000000000 - age(c.relfrozenxid)     AS xids_left
+     FROM pg_class c
+     JOIN pg_namespace n ON n.oid = c.relnamespace
+     WHERE c.relkind IN ('r','m')
+       AND n.nspname NOT IN ('pg_catalog','information_schema') AND n.nspname !~ '^pg_toast'
+     ORDER BY age_xid DESC
+     LIMIT 15;
+     """),
+    ("14) Wait events snapshot (0.5s)", "SNAP_WAIT"),
+    ("15) Replication lag (slots)",
+     """
+     SELECT slot_name,
+            wal_status,
+            pg_size_pretty(pg_wal_lsn_diff(pg_current_wal_lsn(), restart_lsn)) AS retained,
+            active
+     FROM pg_replication_slots;
+     """),
+    ("16) Extensions",
+     """
+     SELECT e.extname,
+            e.extversion,
+            n.nspname AS schema
+     FROM pg_extension e
+     JOIN pg_namespace n ON n.oid = e.extnamespace
+     ORDER BY e.extname;
+     """),
+    ("17) HugePages / Shared memory",
+     """
+     SELECT name, setting FROM pg_settings
+     WHERE name IN ('huge_pages','huge_page_size','shared_memory_type');
+     """),
+    ("18) Archiving / pg_wal size",
+     """
+     SELECT (SELECT setting FROM pg_settings WHERE name='archive_mode')    AS archive_mode,
+            (SELECT setting FROM pg_settings WHERE name='archive_command') AS archive_command,
+            pg_size_pretty(pg_wal_lsn_diff(pg_current_wal_lsn(),'0/0'))    AS current_wal;
+     """),
+]
+
+# sampled twice by the wait-event section, aggregated server-side
+WAIT_EVENTS_SQL = ("SELECT wait_event_type||':'||wait_event AS e, count(*)::int AS c "
+                   "FROM pg_stat_activity WHERE wait_event IS NOT NULL GROUP BY 1")
 
 
 def run_all_sections(pg: Pg) -> None:
-    # Prepare both variants to be resilient across PG versions
-    ckpt_sql_checkpointer = """
-        SELECT
-          num_timed              AS timed_ckpt,
-          num_requested          AS req_ckpt,
-          round(num_requested*100.0/NULLIF(num_timed+num_requested,0),1) AS "req_%",
-          buffers_written        AS buf_ckpt,
-          (SELECT buffers_clean FROM pg_stat_bgwriter)         AS buf_bgwriter,
-          NULL::bigint           AS buf_backend,
-          NULL::bigint           AS backend_fsync,
-          (SELECT buffers_alloc FROM pg_stat_bgwriter)         AS buf_alloc
-        FROM pg_stat_checkpointer;
-    """
-    ckpt_sql_bgwriter = """
-        SELECT
-          NULL::bigint            AS timed_ckpt,
-          NULL::bigint            AS req_ckpt,
-          NULL::numeric           AS "req_%",
-          NULL::bigint            AS buf_ckpt,
-          buffers_clean           AS buf_bgwriter,
-          buffers_backend         AS buf_backend,
-          buffers_backend_fsync   AS backend_fsync,
-          buffers_alloc           AS buf_alloc
-        FROM pg_stat_bgwriter;
-    """
+    # pg_stat_checkpointer exists since PG17; server_version is known locally, no probe needed
+    ckpt_sql = CKPT_SQL_CHECKPOINTER if pg.conn.server_version >= 170000 else CKPT_SQL_BGWRITER
 
-    sections: List[Tuple[str, str]] = [
-        ("2) Checkpoint & bgwriter", "__CKPT__"),
-        ("3) Large tables for partitioning (>20GB)",
-        """
-        SELECT 
-            schemaname || '.' || relname AS table_name,
-            pg_size_pretty(pg_total_relation_size(relid)) AS total_size,
-            pg_size_pretty(pg_relation_size(relid)) AS table_size,
-            pg_size_pretty(
-                (pg_total_relation_size(relid)::bigint - pg_relation_size(relid)::bigint)
-            ) AS index_size,
-            n_live_tup AS live_rows,
-            n_dead_tup AS dead_rows,
-            round(n_dead_tup*100.0/NULLIF(n_live_tup+n_dead_tup,0),1) AS dead_pct,
-            seq_scan,
-            idx_scan,
-            round(idx_scan*100.0/NULLIF(seq_scan+idx_scan,0),1) AS idx_scan_pct
-        FROM pg_stat_user_tables
-        WHERE pg_total_relation_size(relid) > (20::bigint * 1024 * 1024 * 1024)
-        ORDER BY pg_total_relation_size(relid) DESC
-        LIMIT 20;
-        """),
-        ("4) HOT updates (low %)",
-         """
-         SELECT schemaname||'.'||relname        AS table,
-                n_tup_upd                       AS upd,
-                n_tup_hot_upd                   AS hot,
-                round(n_tup_hot_upd*100.0/NULLIF(n_tup_upd,0),1) AS hot_pct
-         FROM pg_stat_user_tables
-         WHERE n_tup_upd > 100
-         ORDER BY hot_pct NULLS FIRST
-         LIMIT 20;
-         """),
-        ("5) Seq vs Index scan",
-         """
-         SELECT schemaname||'.'||relname                          AS table,
-                seq_scan, idx_scan,
-                round(idx_scan*100.0/NULLIF(seq_scan+idx_scan,0),1) AS idx_pct,
-                pg_size_pretty(pg_relation_size(relid))            AS size
-         FROM pg_stat_user_tables
-         WHERE seq_scan + idx_scan > 0
-         ORDER BY seq_scan DESC
-         LIMIT 20;
-         """),
-        ("6) Duplicate indexes",
-         """
-         WITH sig AS (
-           SELECT i.indexrelid,
-                  (indrelid::text||':'||indkey::text||':'||
-                   COALESCE(indexprs::text,'')||':'||COALESCE(indpred::text,'')) AS signature
-           FROM pg_index i
-         )
-         SELECT pg_size_pretty(SUM(pg_relation_size(indexrelid))) AS dup_size,
-                array_agg(indexrelid::regclass)                   AS dup_indexes
-         FROM sig
-         GROUP BY signature
-         HAVING COUNT(*) > 1
-         ORDER BY SUM(pg_relation_size(indexrelid)) DESC;
-         """),
-        ("7) FK without indexes",
-         """
-         WITH fk AS (
-           SELECT conrelid, conname, conkey, confrelid
-           FROM pg_constraint WHERE contype='f'
-         ), mis AS (
-           SELECT fk.conrelid::regclass AS child_table,
-                  array_agg(att.attname ORDER BY att.attnum)   AS key_cols,
-                  fk.confrelid::regclass AS parent_table,
-                  fk.conname             AS fk_name
-           FROM fk
-           JOIN pg_attribute att ON att.attrelid = fk.conrelid
-                                AND att.attnum   = ANY(fk.conkey)
-           WHERE NOT EXISTS (
-                 SELECT 1 FROM pg_index i
-                 WHERE i.indrelid = fk.conrelid
-                   AND i.indisvalid
-                   AND i.indkey::text = array_to_string(fk.conkey,' ')
-           )
-           GROUP BY child_table, parent_table, fk_name
-         )
-         SELECT child_table,
-                key_cols,
-                parent_table,
-                fk_name
-         FROM mis
-         ORDER BY child_table;
-         """),
-        ("8) Big tables without PK",
-         """
-         SELECT c.relname                 AS table,
-                pg_size_pretty(pg_total_relation_size(c.oid)) AS total,
-                c.reltuples::bigint        AS rows
-         FROM pg_class c
-         JOIN pg_namespace n ON n.oid = c.relnamespace
-         WHERE c.relkind='r'
-           AND n.nspname NOT IN ('pg_catalog','information_schema','pg_toast')
-           AND pg_total_relation_size(c.oid) > 100*1024*1024
-           AND NOT EXISTS (SELECT 1 FROM pg_constraint WHERE contype='p' AND conrelid=c.oid)
-         ORDER BY pg_total_relation_size(c.oid) DESC
-         LIMIT 20;
-         """),
-        ("9) Unused indexes",
-         """
-         SELECT schemaname||'.'||relname        AS table,
-                indexrelname                    AS index,
-                pg_size_pretty(pg_relation_size(indexrelid)) AS size,
-                idx_scan
-         FROM pg_stat_user_indexes
-         JOIN pg_index  USING (indexrelid)
-         WHERE idx_scan = 0
-           AND indisunique IS FALSE
-           AND pg_relation_size(indexrelid) > 10*1024*1024
-         ORDER BY pg_relation_size(indexrelid) DESC
-         LIMIT 20;
-         """),
-        ("10) Dead-tuples / bloat",
-         """
-         SELECT schemaname||'.'||relname                     AS table,
-                n_live_tup, n_dead_tup,
-                round(n_dead_tup*100.0/NULLIF(n_live_tup+n_dead_tup,0),1) AS dead_pct,
-                pg_size_pretty(pg_total_relation_size(relid))             AS total_size
-         FROM pg_stat_user_tables
-         WHERE n_dead_tup > 0
-         ORDER BY dead_pct DESC
-         LIMIT 20;
-         """),
-        ("11) Temp-files usage",
-         """
-         SELECT datname,
-                temp_files,
-                pg_size_pretty(temp_bytes) AS temp_bytes
-         FROM pg_stat_database
-         WHERE temp_files > 0
-         ORDER BY temp_bytes DESC
-         LIMIT 15;
-         """),
-        ("12) XID freeze age (databases)",
-         """
-         WITH cur AS (SELECT txid_current()::bigint AS nowxid)
-         SELECT datname,
-                age(datfrozenxid)                          AS age_xid,
-                2000000000 - age(datfrozenxid)             AS xids_left
-         FROM pg_database, cur
-         ORDER BY age_xid DESC;
-         """),
-        ("13) XID freeze age (tables)",
-         """
-         WITH cur AS (SELECT txid_current()::bigint AS nowxid)
-         SELECT s.schemaname||'.'||s.relname         AS table,
-                age(c.relfrozenxid)                  AS age_xid,
-                2000000000 - age(c.relfrozenxid)     AS xids_left
-         FROM pg_stat_user_tables s
-         JOIN pg_class c ON c.oid = s.relid
-         ORDER BY age_xid DESC
-         LIMIT 15;
-         """),
-        ("14) Wait events snapshot (0.5s)", "SNAP_WAIT"),
-        ("15) Replication lag (slots)",
-         """
-         SELECT slot_name,
-                wal_status,
-                pg_size_pretty(pg_wal_lsn_diff(pg_current_wal_lsn(), restart_lsn)) AS retained,
-                active
-         FROM pg_replication_slots;
-         """),
-        ("16) Extensions",
-         """
-         SELECT e.extname,
-                e.extversion,
-                n.nspname AS schema
-         FROM pg_extension e
-         JOIN pg_namespace n ON n.oid = e.extnamespace
-         ORDER BY e.extname;
-         """),
-        ("17) HugePages / Shared memory",
-         """
-         SELECT name, setting FROM pg_settings
-         WHERE name IN ('huge_pages','huge_page_size','shared_memory_type');
-         """),
-        ("18) Archiving / pg_wal size",
-         """
-         SELECT setting AS archive_mode      FROM pg_settings WHERE name='archive_mode';
-         SELECT setting AS archive_command   FROM pg_settings WHERE name='archive_command';
-         SELECT pg_size_pretty(pg_wal_lsn_diff(pg_current_wal_lsn(),'0/0')) AS current_wal;
-         """),
+    # Every section except the timed wait-event sampling is independent, so all of
+    # their statements are fetched in one round trip up front and printed in order.
+    # If the batch fails (e.g. txid_current() or pg_current_wal_lsn() on a standby),
+    # the sections run one by one so the others still print.
+    section_stmts: List[Optional[str]] = [
+        None if sql == "SNAP_WAIT" else ckpt_sql if sql == "__CKPT__" else sql
+        for _title, sql in SECTIONS
     ]
+    try:
+        results = iter(pg.qall_many([st for st in section_stmts if st is not None]))
+    except Exception:
+        results = None
 
-    for title, sql in sections:
+    for (title, sql), stmt in zip(SECTIONS, section_stmts):
         h1(title)
         if sql == "SNAP_WAIT":
-            snap1 = pg.qall("SELECT wait_event_type||':'||wait_event FROM pg_stat_activity WHERE wait_event IS NOT NULL")
+            # each snapshot is already aggregated server-side; sum the two
+            snap1 = pg.qall(WAIT_EVENTS_SQL)
             time.sleep(0.5)
-            snap2 = pg.qall("SELECT wait_event_type||':'||wait_event FROM pg_stat_activity WHERE wait_event IS NOT NULL")
-            counts: Dict[str, int] = {}
-            for (e,) in snap1 + snap2:
-                counts[e] = counts.get(e, 0) + 1
-            print(f"{'event':25} | count")
-            print("-" * 27 + "+" + "-" * 7)
-            for k, v in sorted(counts.items(), key=lambda kv: kv[1], reverse=True)[:10]:
-                print(f"{k:25} | {v}")
+            snap2 = pg.qall(WAIT_EVENTS_SQL)
+            counts: Counter = Counter()
+            counts.update(dict(snap1))
+            counts.update(dict(snap2))
+            buf = io.StringIO()
+            buf.write(f"{'event':25} | count\n")
+            buf.write("-" * 27 + "+" + "-" * 7 + "\n")
+            for k, v in counts.most_common(10):
+                buf.write(f"{k:25} | {v}\n")
+            sys.stdout.write(buf.getvalue())
+        elif results is not None:
+            print_result(*next(results))
         else:
-            if sql == "__CKPT__":
-                # Try pg_stat_checkpointer first (PG16+), fall back to bgwriter
-                try:
-                    print_query(pg, ckpt_sql_checkpointer)
-                except Exception:
-                    print_query(pg, ckpt_sql_bgwriter)
-            else:
-                # allow multiple statements separated by ;
-                stmts = [s.strip() for s in sql.strip().split(";") if s.strip()]
-                for st in stmts:
-                    print_query(pg, st + ";")
+            print_query(pg, stmt)
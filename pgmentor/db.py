@@ -1,15 +1,26 @@
 import psycopg2
-from dataclasses import dataclass
-from typing import Any, List, Optional, Sequence, Tuple
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Set, Tuple
 
 @dataclass
 class Pg:
     dsn: str
     conn: Any = None
+    # per-session caches, reset on reconnect
+    # name -> (current_setting(name), pg_settings.setting, pg_settings.unit)
+    _settings: Dict[str, Tuple[str, str, Optional[str]]] = field(default_factory=dict, init=False, repr=False, compare=False)
+    _cost_to_sec: Optional[float] = field(default=None, init=False, repr=False, compare=False)
+    # pg_temp.pgmentor_explain: None = not tried yet, False = unavailable on this session
+    _explain_fn: Optional[bool] = field(default=None, init=False, repr=False, compare=False)
+    _prepared: Set[str] = field(default_factory=set, init=False, repr=False, compare=False)
 
     def __enter__(self):
         self.conn = psycopg2.connect(self.dsn)
         self.conn.autocommit = True
+        self._settings = {}
+        self._cost_to_sec = None
+        self._explain_fn = None
+        self._prepared = set()
         return self
     
     def __exit__(self, exc_type, exc, tb):
@@ -28,6 +39,33 @@ class Pg:
     def commit(self):
         self.conn.commit()
 
+    def prepare(self, name: str, sql: str) -> None:
+        # server-side PREPARE, issued once per connection; run it with EXECUTE name(...)
+        if name not in self._prepared:
+            self.exec(f"PREPARE {name} AS {sql}")
+            self._prepared.add(name)
+
+    def settings(self) -> Dict[str, Tuple[str, str, Optional[str]]]:
+        # the pg_settings snapshot is fetched in one round trip on first use and served
+        # from memory afterwards
+        if not self._settings:
+            self._settings = {
+                name: (value, setting, unit)
+                for name, value, setting, unit in self.qall(
+                    "SELECT name, current_setting(name), setting, unit FROM pg_settings")
+            }
+        return self._settings
+
+    def get_setting(self, name: str) -> Optional[str]:
+        # display form, e.g. '4MB'
+        row = self.settings().get(name)
+        return row[0] if row else None
+
+    def get_raw_setting(self, name: str) -> Tuple[Optional[str], Optional[str]]:
+        # (setting, unit) as pg_settings reports them, e.g. ('4096', 'kB')
+        row = self.settings().get(name)
+        return (row[1], row[2]) if row else (None, None)
+
     def qval(self, sql: str, params: Optional[Sequence[Any]] = None) -> Optional[Any]:
         with self.conn.cursor() as cur:
             cur.execute(sql, params)
@@ -44,6 +82,42 @@ class Pg:
             cur.execute(sql, params)
             return cur.fetchall()
 
+    def qall_desc(self, sql: str, params: Optional[Sequence[Any]] = None) -> Tuple[List[str], List[Tuple[Any, ...]]]:
+        # rows plus column names from the same execution
+        with self.conn.cursor() as cur:
+            cur.execute(sql, params)
+            return [d.name for d in cur.description], cur.fetchall()
+
+    def qall_many(self, sqls: Sequence[str]) -> List[Tuple[List[str], List[Tuple[Any, ...]]]]:
+        # Runs independent SELECTs in a single round trip: each one becomes a json_agg()
+        # scalar subquery of one statement, unpacked here into (column names, rows).
+        # Rows are numbered as the subquery delivers them and aggregated by that number,
+        # so its ORDER BY survives. One failing SELECT fails the whole batch.
+        if not sqls:
+            return []
+        cols = ", ".join(
+            f"(SELECT json_agg(t ORDER BY t.pgmentor_ord) FROM "
+            f"(SELECT s.*, row_number() OVER () AS pgmentor_ord FROM ({sql.strip().rstrip(';')}) s) t)"
+            for sql in sqls
+        )
+        results = []
+        for objs in self.qrow(f"SELECT {cols}"):
+            objs = objs or []
+            for o in objs:
+                del o["pgmentor_ord"]
+            names = list(objs[0]) if objs else []
+            results.append((names, [tuple(o.values()) for o in objs]))
+        return results
+
+    def qiter(self, sql: str, params: Optional[Sequence[Any]] = None,
+              name: str = "pgmentor_iter", itersize: int = 500) -> Iterator[Tuple[Any, ...]]:
+        # server-side cursor: rows arrive itersize at a time instead of all at once;
+        # WITH HOLD lets it live outside a transaction block in autocommit mode
+        with self.conn.cursor(name=name, withhold=True) as cur:
+            cur.itersize = itersize
+            cur.execute(sql, params)
+            yield from cur
+
     def exec(self, sql: str, params: Optional[Sequence[Any]] = None) -> None:
         with self.conn.cursor() as cur:
             cur.execute(sql, params)    
\ No newline at end of file
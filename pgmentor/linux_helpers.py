@@ -0,0 +1,53 @@
+from functools import lru_cache
+from typing import Dict
+import os
+
+
+@lru_cache(maxsize=1)
+def _meminfo() -> Dict[str, int]:
+    # /proc/meminfo is read once per process; every lookup is then a dict hit
+    info: Dict[str, int] = {}
+    try:
+        with open("/proc/meminfo", "r") as f:
+            for line in f:
+                key, _, rest = line.partition(":")
+                parts = rest.split()
+                if parts:
+                    try:
+                        info[key] = int(parts[0])
+                    except ValueError:
+                        pass
+    except Exception:
+        pass
+    return info
+
+
+def parse_meminfo_kb(key: str) -> int:
+    return _meminfo().get(key.rstrip(":"), 0)
+
+
+def read_first(path: str, default: str = "n/a") -> str:
+    # /proc and /sys values are a few bytes: one raw read, no buffered text stack
+    try:
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            return os.read(fd, 4096).decode().strip()
+        finally:
+            os.close(fd)
+    except Exception:
+        return default
+
+
+def is_ssd() -> bool:
+    # any rotational disk means the host has HDDs; virtual devices report nothing useful
+    try:
+        with os.scandir("/sys/block") as it:
+            for dev in it:
+                if dev.name.startswith(("loop", "ram", "dm-")):
+                    continue
+                # a missing file reads as the default, no separate stat needed
+                if read_first(f"{dev.path}/queue/rotational", "0") == "1":
+                    return False
+    except Exception:
+        pass
+    return True
@@ -1,25 +1,14 @@
 from dataclasses import dataclass
 from pgmentor.db import Pg
+from pgmentor.linux_helpers import is_ssd, parse_meminfo_kb
 import os
 
-def parse_meminfo_kb(key: str) -> int:
-    try:
-        with open("/proc/meminfo", "r") as f:
-            for line in f:
-                if line.startswith(key):
-                    return int(line.split()[1])
-    except Exception:
-        pass
-    return 0
-def read_first(path: str, default: str = "n/a") -> str:
-    try:
-        with open(path, "r") as f:
-            return f.read().strip()
-    except Exception:
-        return default
-    
-@dataclass
+
+@dataclass(frozen=True)
 class Metrics:
+    # read once per parameter by the recommendation formulas; slots skip the instance dict,
+    # frozen makes it hashable so those formulas can be memoized per snapshot
+    __slots__ = ("RAM_MB", "CPU", "SSD", "HITR", "CKPT_SEC", "SORT_MB")
     RAM_MB: int
     CPU: int
     SSD: bool
@@ -31,16 +20,7 @@ def gather_metrics(pg: Pg) -> Metrics:
     RAM_MB = parse_meminfo_kb("MemTotal:") // 1024
     CPU = os.cpu_count() or 1
     # Определяем SSD: если найден хоть один rotational==1 → считаем есть HDD
-    SSD = True
-    try:
-        for dev in os.listdir("/sys/block"):
-            path = f"/sys/block/{dev}/queue/rotational"
-            if os.path.isfile(path):
-                val = read_first(path, "0")
-                if val.strip() == "1":
-                    SSD = False
-    except Exception:
-        pass
+    SSD = is_ssd()
 
     # HITR (buffer cache hit ratio)
     hitr_val = pg.qval(
@@ -58,31 +38,26 @@ def gather_metrics(pg: Pg) -> Metrics:
 
     # CKPT_SEC (средний интервал между чекпойнтами)
     ckpt_seconds = 0.0
-    # PG16+: pg_stat_checkpointer
-    try:
-        val = pg.qval(
-            """
+    # pg_stat_checkpointer exists since PG17; pick the view by server_version
+    # instead of probing it and failing over on older servers
+    if pg.conn.server_version >= 170000:
+        ckpt_sql = """
             SELECT COALESCE(EXTRACT(EPOCH FROM now()-stats_reset)/
                    NULLIF(num_timed+num_requested,0),0)
             FROM pg_stat_checkpointer;
             """
-        )
+    else:
+        ckpt_sql = """
+            SELECT COALESCE(EXTRACT(EPOCH FROM now()-stats_reset)/
+                   NULLIF(checkpoints_timed+checkpoints_req,0),0)
+            FROM pg_stat_bgwriter;
+            """
+    try:
+        val = pg.qval(ckpt_sql)
         if val is not None:
             ckpt_seconds = float(val)
     except Exception:
-        # older PG: pg_stat_bgwriter
-        try:
-            val = pg.qval(
-                """
-                SELECT COALESCE(EXTRACT(EPOCH FROM now()-stats_reset)/
-                       NULLIF(checkpoints_timed+checkpoints_req,0),0)
-                FROM pg_stat_bgwriter;
-                """
-            )
-            if val is not None:
-                ckpt_seconds = float(val)
-        except Exception:
-            ckpt_seconds = 0.0
+        ckpt_seconds = 0.0
 
     CKPT_SEC = int(ckpt_seconds)
 
@@ -1,3 +1,4 @@
+import sys
 from typing import List, Tuple, Sequence, Any
 
 def h1(title: str) -> None:
@@ -7,22 +8,27 @@ def h1(title: str) -> None:
 def print_kv_table(rows: List[Tuple[str, str, str, str, str, str, str]]) -> None:
     # | parameter | current | recommended | action | reason | priority | speedup |
     header = ("parameter", "current", "recommended", "action", "reason", "priority", "speedup")
-    all_rows = [header] + rows
-    widths = [max(len(str(r[i])) for r in all_rows) for i in range(len(header))]
-    def fmt(r: Sequence[Any]) -> str:
-        return (
-            f"| {str(r[0]).ljust(widths[0])} | "
-            f"{str(r[1]).ljust(widths[1])} | "
-            f"{str(r[2]).ljust(widths[2])} | "
-            f"{str(r[3]).ljust(widths[3])} | "
-            f"{str(r[4]).ljust(widths[4])} | "
-            f"{str(r[5]).ljust(widths[5])} | "
-            f"{str(r[6]).ljust(widths[6])} |"
-        )
+    # stringify every cell once, sorted by parameter; widths come from one pass per column
+    str_rows = [header] + sorted((tuple(map(str, r)) for r in rows), key=lambda r: r[0])
+    widths = [max(map(len, col)) for col in zip(*str_rows)]
+    def fmt(r: Sequence[str]) -> str:
+        return "| " + " | ".join(v.ljust(w) for v, w in zip(r, widths)) + " |"
     sep = "+-" + "-+-".join("-" * w for w in widths) + "-+"
-    print(sep)
-    print(fmt(header))
-    print(sep)
-    for r in sorted(rows, key=lambda r: r[0]):
-        print(fmt(r))
-    print(sep)
\ No newline at end of file
+    lines = [sep, fmt(str_rows[0]), sep]
+    lines.extend(fmt(r) for r in str_rows[1:])
+    lines.append(sep)
+    sys.stdout.write("\n".join(lines) + "\n")
+
+
+def print_result(desc: Sequence[str], rows: List[Tuple[Any, ...]]) -> None:
+    if not rows:
+        print("(no rows)")
+        return
+    # stringify each cell once; widths come from one pass per column, header included
+    srows = [tuple(map(str, r)) for r in rows]
+    width = [max(map(len, col)) for col in zip(desc, *srows)]
+    # build the whole table, then emit it with a single write
+    out = [" | ".join(h.ljust(w) for h, w in zip(desc, width)),
+           "-+-".join("-" * w for w in width)]
+    out.extend(" | ".join(v.ljust(w) for v, w in zip(r, width)) for r in srows)
+    sys.stdout.write("\n".join(out) + "\n")
@@ -1,4 +1,7 @@
-from typing import Any, Optional, List, Tuple
+from dataclasses import dataclass
+from functools import lru_cache
+from types import MappingProxyType
+from typing import Any, Callable, Dict, Mapping, Optional, List, Tuple
 from pgmentor.metrics import Metrics
 from pgmentor.db import Pg
 
@@ -10,121 +13,78 @@ def to_unit(mb: int, unit: str) -> int:
         return mb * 1024 // 8
     return mb
 
-def note(p: str) -> str:
-    notes = {
-        "shared_buffers": "≈25 % RAM",
-        "effective_cache_size": "≈75 % RAM",
-        "maintenance_work_mem": "5 % RAM (cap 2 GB)",
-        "wal_buffers": "≥16 MB if small",
-        "min_wal_size": "ckpt-interval",
-        "max_wal_size": "ckpt-interval",
-        "work_mem": "1.5×p90 sort",
-        "temp_buffers": "≈5 % shared",
-        "wal_compression": "compress WAL",
-        "wal_writer_delay": "10 ms SSD",
-        "wal_keep_size": "2 GB repl lag",
-        "synchronous_commit": "remote_write (OLTP)",
-        "jit": "OFF (OLTP)",
-        "track_io_timing": "IO metrics",
-        "log_min_duration_statement": "slow ≥1 s",
-        "autovacuum_naptime": "10 s loop",
-        "autovacuum_vacuum_cost_delay": "2 ms burst",
-    }
-    return notes.get(p, "")
+def _current_int(pg: Pg, name: str) -> int:
+    cur, _unit = pg.get_raw_setting(name)
+    try:
+        return int(cur)
+    except Exception:
+        return 0
+
+
+# param -> formula(metrics, profile); built once at import, looked up per param
+_RAW_HANDLERS: Dict[str, Callable[[Metrics, str], Any]] = {
+    "max_connections": lambda m, profile: 200,
+    "shared_buffers": lambda m, profile: m.RAM_MB // 4,
+    "effective_cache_size": lambda m, profile: (m.RAM_MB * 3) // 4,
+    "maintenance_work_mem": lambda m, profile: min(2048, m.RAM_MB // 20),
+    "checkpoint_completion_target": lambda m, profile: 0.9,
+    "checkpoint_timeout": lambda m, profile: 900,
+    "wal_buffers": lambda m, profile: 16,
+    "min_wal_size": lambda m, profile: 2048 if m.CKPT_SEC > 1800 else 1024,
+    "max_wal_size": lambda m, profile: 16384 if m.CKPT_SEC > 1800 else 8192,
+    "random_page_cost": lambda m, profile: 1.1 if m.SSD else 4,
+    "effective_io_concurrency": lambda m, profile: 256 if m.SSD else 2,
+    "work_mem": lambda m, profile: max(4, (m.SORT_MB * 3) // 2),
+    "temp_buffers": lambda m, profile: max(16, (m.RAM_MB // 4) * 5 // 100),
+    "wal_compression": lambda m, profile: "on",
+    "wal_writer_delay": lambda m, profile: 10,
+    "wal_keep_size": lambda m, profile: 2048,
+    "max_wal_senders": lambda m, profile: min(10, m.CPU),
+    "max_replication_slots": lambda m, profile: min(10, m.CPU),
+    "synchronous_commit": lambda m, profile: "remote_write",
+    "jit": lambda m, profile: "on" if profile == "olap" else "off",
+    "track_io_timing": lambda m, profile: "on",
+    "log_min_duration_statement": lambda m, profile: 1000,
+    "log_checkpoints": lambda m, profile: "on",
+    "log_autovacuum_min_duration": lambda m, profile: 500,
+    "autovacuum_naptime": lambda m, profile: 10,
+    "autovacuum_vacuum_cost_limit": lambda m, profile: 2000,
+    "autovacuum_vacuum_cost_delay": lambda m, profile: 2,
+    "autovacuum_max_workers": lambda m, profile: (m.CPU // 2) if profile == "olap" else 3,
+    "max_worker_processes": lambda m, profile: max(8, m.CPU),
+    "max_parallel_workers": lambda m, profile: min(16, m.CPU),
+    "max_parallel_workers_per_gather": lambda m, profile: (m.CPU + 1) // 2,
+    "max_parallel_maintenance_workers": lambda m, profile: min(4, m.CPU),
+}
+
+# params never recommended below their current value: current setting -> floor
+_CURRENT_FLOOR: Dict[str, Callable[[int], int]] = {
+    # wal_buffers is reported in 8kB pages
+    "wal_buffers": lambda cur: cur * 8 // 1024,
+    "max_worker_processes": lambda cur: cur,
+    "max_parallel_workers": lambda cur: cur,
+    "max_parallel_workers_per_gather": lambda cur: cur,
+    "max_parallel_maintenance_workers": lambda cur: cur,
+}
+
+
+# Metrics is frozen and hashable, so the metric-only part is computed once per
+# (param, metrics, profile); the server's current value is applied afterwards
+@lru_cache(maxsize=256)
+def _formula_value(p: str, m: Metrics, profile: str) -> Optional[Any]:
+    h = _RAW_HANDLERS.get(p)
+    return h(m, profile) if h else None
 
 
 def raw_value(p: str, m: Metrics, profile: str, pg: Pg) -> Optional[Any]:
-    RAM_MB = m.RAM_MB
-    CPU = m.CPU
-    SSD = m.SSD
-    CKPT_SEC = m.CKPT_SEC
-    SORT_MB = m.SORT_MB
-
-    def current_setting(name: str) -> int:
-        cur = pg.qval("SELECT setting FROM pg_settings WHERE name=%s;", (name,))
-        try:
-            return int(cur)
-        except Exception:
-            return 0
-
-    if p == "max_connections":
-        return 200
-    if p == "shared_buffers":
-        return RAM_MB // 4
-    if p == "effective_cache_size":
-        return (RAM_MB * 3) // 4
-    if p == "maintenance_work_mem":
-        return min(2048, RAM_MB // 20)
-    if p == "checkpoint_completion_target":
-        return 0.9
-    if p == "checkpoint_timeout":
-        return 900
-    if p == "wal_buffers":
-        cur = current_setting("wal_buffers")
-        mb = cur * 8 // 1024
-        v = 16 if mb < 16 else mb
+    v = _formula_value(p, m, profile)
+    floor = _CURRENT_FLOOR.get(p)
+    if v is None or floor is None:
         return v
-    if p == "min_wal_size":
-        return 2048 if CKPT_SEC > 1800 else 1024
-    if p == "max_wal_size":
-        return 16384 if CKPT_SEC > 1800 else 8192
-    if p == "random_page_cost":
-        return 1.1 if SSD else 4
-    if p == "effective_io_concurrency":
-        return 256 if SSD else 2
-    if p == "work_mem":
-        return max(4, (SORT_MB * 3) // 2)
-    if p == "temp_buffers":
-        sb = RAM_MB // 4
-        return max(16, sb * 5 // 100)
-    if p == "wal_compression":
-        return "on"
-    if p == "wal_writer_delay":
-        return 10
-    if p == "wal_keep_size":
-        return 2048
-    if p in ("max_wal_senders", "max_replication_slots"):
-        return 10 if CPU > 10 else CPU
-    if p == "synchronous_commit":
-        return "remote_write"
-    if p == "jit":
-        return "on" if profile == "olap" else "off"
-    if p == "track_io_timing":
-        return "on"
-    if p == "log_min_duration_statement":
-        return 1000
-    if p == "log_checkpoints":
-        return "on"
-    if p == "log_autovacuum_min_duration":
-        return 500
-    if p == "autovacuum_naptime":
-        return 10
-    if p == "autovacuum_vacuum_cost_limit":
-        return 2000
-    if p == "autovacuum_vacuum_cost_delay":
-        return 2
-    if p == "autovacuum_max_workers":
-        return (CPU // 2) if profile == "olap" else 3
-    if p == "max_worker_processes":
-        v = 8 if CPU < 8 else CPU
-        cur = current_setting("max_worker_processes")
-        return max(v, cur)
-    if p == "max_parallel_workers":
-        v = CPU if CPU < 16 else 16
-        cur = current_setting("max_parallel_workers")
-        return max(v, cur)
-    if p == "max_parallel_workers_per_gather":
-        v = (CPU + 1) // 2
-        cur = current_setting("max_parallel_workers_per_gather")
-        return max(v, cur)
-    if p == "max_parallel_maintenance_workers":
-        v = CPU if CPU < 4 else 4
-        cur = current_setting("max_parallel_maintenance_workers")
-        return max(v, cur)
-    return None
-
-
-PARAMS = [
+    return max(v, floor(_current_int(pg, p)))
+
+
+PARAMS = (
     "max_connections",
     "shared_buffers",
     "effective_cache_size",
@@ -157,99 +117,121 @@ PARAMS = [
     "max_parallel_workers",
     "max_parallel_workers_per_gather",
     "max_parallel_maintenance_workers",
-]
-
-
-def build_reco(pg: Pg, m: Metrics, profile: str) -> List[Tuple[str, str, str]]:
-    rows: List[Tuple[str, str, str, str, str]] = [("parameter", "rec", "why", "priority", "speedup")]
-
-    def parse_with_unit(val_str: str, unit: Optional[str]) -> float:
-        if val_str is None:
-            return 0.0
-        try:
-            # Numeric fast-path
-            return float(val_str)
-        except Exception:
-            pass
-        # Non-numeric or has unit suffix in pg_settings (we'll rely on unit column)
-        if not unit:
-            return 0.0
-        try:
-            v = float(val_str)
-            return v
-        except Exception:
-            return 0.0
-
-    def estimate_priority_and_speedup(param: str, cur_str: Optional[str], rec_str: str, unit: Optional[str]) -> Tuple[str, str]:
-        # Default
-        priority = "low"
-        speed = 0
-
-        # Try to get numeric delta where it makes sense
-        cur_num = parse_with_unit(cur_str or "0", unit)
-        try:
-            rec_num = float(rec_str) if rec_str.replace('.', '', 1).isdigit() else cur_num
-        except Exception:
-            rec_num = cur_num
-        delta_ratio = 0.0
-        if cur_num > 0:
-            try:
-                delta_ratio = max(0.0, (rec_num - cur_num) / cur_num)
-            except Exception:
-                delta_ratio = 0.0
-
-        # Heuristics by parameter
-        if param in ("work_mem",):
-            if rec_num > cur_num:
-                priority = "high" if delta_ratio >= 0.5 else "medium"
-                speed = 10 if delta_ratio >= 1.0 else (7 if delta_ratio >= 0.5 else 3)
-        elif param in ("shared_buffers", "effective_cache_size"):
-            if rec_num > cur_num:
-                priority = "medium"
-                speed = 5 if delta_ratio >= 0.5 else 2
-        elif param in ("random_page_cost",):
-            # On SSD lowering cost can help planner
-            priority = "medium"
-            speed = 3
-        elif param in ("effective_io_concurrency",):
-            priority = "medium"
-            speed = 3
-        elif param in ("checkpoint_timeout", "min_wal_size", "max_wal_size", "wal_buffers", "checkpoint_completion_target"):
-            priority = "medium"
-            speed = 2
-        elif param in ("jit",):
-            # For OLTP JIT off tends to help latency
-            priority = "medium" if profile == "oltp" else "low"
-            speed = 2 if profile == "oltp" else 1
-        elif param in ("synchronous_commit",):
-            # remote_write for OLTP can improve throughput with acceptable durability trade-offs
-            priority = "medium"
-            speed = 3
-        elif param in ("wal_compression",):
-            priority = "low"
-            speed = 1
-        elif param.startswith("autovacuum_") or param.startswith("log_") or param in ("track_io_timing",):
-            priority = "low"
-            speed = 0
-
-        # Boundaries
-        speed = max(0, min(20, int(speed)))
-        return priority, f"{speed}%"
-
-    for p in PARAMS:
-        v = raw_value(p, m, profile, pg)
-        if v is None:
-            continue
-        unit = pg.qval("SELECT unit FROM pg_settings WHERE name=%s;", (p,))
-        cur = pg.qval("SELECT setting FROM pg_settings WHERE name=%s;", (p,))
-        if unit:
-            try:
-                mb = int(v)
-                rec_val = str(to_unit(mb, unit))
-            except Exception:
-                rec_val = str(v)
-        else:
-            rec_val = str(v)
-        priority, speedup = estimate_priority_and_speedup(p, str(cur) if cur is not None else None, rec_val, unit)
-        rows.append((p, rec_val, note(p), priority, speedup))
-    return rows
\ No newline at end of file
+)
+
+
+def _to_number(val: Optional[str]) -> Optional[float]:
+    # pg_settings.setting and the recommended values are bare numbers in the setting's
+    # base unit, or words such as 'on'; the latter are not numeric
+    if val is None:
+        return None
+    try:
+        return float(val)
+    except ValueError:
+        return None
+
+
+def _delta_ratio(cur_num: float, rec_num: float) -> float:
+    return max(0.0, (rec_num - cur_num) / cur_num) if cur_num > 0 else 0.0
+
+
+def _prio_work_mem(cur_num: float, rec_num: float, profile: str) -> Tuple[str, int]:
+    if rec_num <= cur_num:
+        return "low", 0
+    delta_ratio = _delta_ratio(cur_num, rec_num)
+    return ("high" if delta_ratio >= 0.5 else "medium",
+            10 if delta_ratio >= 1.0 else (7 if delta_ratio >= 0.5 else 3))
+
+
+def _prio_memory(cur_num: float, rec_num: float, profile: str) -> Tuple[str, int]:
+    if rec_num <= cur_num:
+        return "low", 0
+    return "medium", 5 if _delta_ratio(cur_num, rec_num) >= 0.5 else 2
+
+
+def _prio_jit(cur_num: float, rec_num: float, profile: str) -> Tuple[str, int]:
+    # For OLTP JIT off tends to help latency
+    return ("medium", 2) if profile == "oltp" else ("low", 1)
+
+
+@dataclass(frozen=True)
+class ParamMeta:
+    note: str = ""
+    prio: str = "low"
+    speed: int = 0
+    # set when the estimate depends on the values: (cur_num, rec_num, profile) -> (priority, speed)
+    classifier: Optional[Callable[[float, float, str], Tuple[str, int]]] = None
+
+
+# everything known about a parameter besides its formula, in one lookup;
+# a read-only view, built once at import
+_PARAM_META: Mapping[str, ParamMeta] = MappingProxyType({
+    "shared_buffers": ParamMeta("≈25 % RAM", classifier=_prio_memory),
+    "effective_cache_size": ParamMeta("≈75 % RAM", classifier=_prio_memory),
+    "maintenance_work_mem": ParamMeta("5 % RAM (cap 2 GB)"),
+    "checkpoint_completion_target": ParamMeta("", "medium", 2),
+    "checkpoint_timeout": ParamMeta("", "medium", 2),
+    "wal_buffers": ParamMeta("≥16 MB if small", "medium", 2),
+    "min_wal_size": ParamMeta("ckpt-interval", "medium", 2),
+    "max_wal_size": ParamMeta("ckpt-interval", "medium", 2),
+    # On SSD lowering cost can help planner
+    "random_page_cost": ParamMeta("", "medium", 3),
+    "effective_io_concurrency": ParamMeta("", "medium", 3),
+    "work_mem": ParamMeta("1.5×p90 sort", classifier=_prio_work_mem),
+    "temp_buffers": ParamMeta("≈5 % shared"),
+    "wal_compression": ParamMeta("compress WAL", "low", 1),
+    "wal_writer_delay": ParamMeta("10 ms SSD"),
+    "wal_keep_size": ParamMeta("2 GB repl lag"),
+    # remote_write for OLTP can improve throughput with acceptable durability trade-offs
+    "synchronous_commit": ParamMeta("remote_write (OLTP)", "medium", 3),
+    "jit": ParamMeta("OFF (OLTP)", classifier=_prio_jit),
+    "track_io_timing": ParamMeta("IO metrics"),
+    "log_min_duration_statement": ParamMeta("slow ≥1 s"),
+    "autovacuum_naptime": ParamMeta("10 s loop"),
+    "autovacuum_vacuum_cost_delay": ParamMeta("2 ms burst"),
+})
+_NO_META = ParamMeta()
+
+
+def note(p: str) -> str:
+    return _PARAM_META.get(p, _NO_META).note
+
+
+# pure function of its (hashable) arguments, so repeated builds hit the cache
+@lru_cache(maxsize=512)
+def _estimate_prio(param: str, cur_str: Optional[str], rec_str: str, profile: str) -> Tuple[str, str]:
+    # already at the recommended value: applying it gains nothing
+    if cur_str == rec_str:
+        return "low", "0%"
+    meta = _PARAM_META.get(param, _NO_META)
+    if meta.classifier is None:
+        return meta.prio, f"{meta.speed}%"
+
+    # Try to get numeric delta where it makes sense
+    cur_num = _to_number(cur_str) or 0.0
+    rec_num = _to_number(rec_str)
+    if rec_num is None:
+        rec_num = cur_num
+    priority, speed = meta.classifier(cur_num, rec_num, profile)
+
+    # Boundaries
+    speed = max(0, min(20, int(speed)))
+    return priority, f"{speed}%"
+
+
+def _build_row(pg: Pg, p: str, v: Any, profile: str) -> Tuple[str, str, str, str, str]:
+    cur, unit = pg.get_raw_setting(p)
+    # only numeric formulas are in MB and need converting to the setting's unit
+    if unit and isinstance(v, (int, float)):
+        rec_val = str(to_unit(int(v), unit))
+    else:
+        rec_val = str(v)
+    # the snapshot already holds the setting as text; pass it through as is
+    priority, speedup = _estimate_prio(p, cur, rec_val, profile)
+    return p, rec_val, note(p), priority, speedup
+
+
+def build_reco(pg: Pg, m: Metrics, profile: str) -> List[Tuple[str, str, str, str, str]]:
+    values = ((p, raw_value(p, m, profile, pg)) for p in PARAMS)
+    return [("parameter", "rec", "why", "priority", "speedup"),
+            *(_build_row(pg, p, v, profile) for p, v in values if v is not None)]